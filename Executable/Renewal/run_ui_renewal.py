@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Calculates the incidence from the renewal equation for gamma-distributed latent and infectious periods.
+"""
+import sys
+sys.path.insert(0,"../modules")
+
+import argparse
+from os.path import isfile, exists, dirname
+from os import mkdir
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+from jls_renewal import generation_interval_pmf, renewal_incidence, growth_rate, growth_rate_check
+
+# names of the relevant columns
+COLS = ['e->i_mean',
+        'e->i_dispersion',
+        'i->r_mean',
+        'i->r_dispersion',
+        's->e:i_R_0']
+
+def main():
+    parser = getArguments()
+    argument = parser.parse_args()
+    check(argument)
+    df = argument.df
+    horizon = argument.horizon
+    length = argument.length if argument.length is not None else horizon
+    for index, row in df.iterrows():
+        (e_mu, e_kappa, i_mu, i_kappa, r0) = row.to_list()
+        print('parameter set', index, ':')
+        print('    Latent Gamma(', e_mu, e_kappa, ')')
+        print('    Infectious Gamma(', i_mu, i_kappa, ')')
+        print('    R_0 (', r0, ')')
+    # Integrates the renewal equation for all rows of the input DataFrame at once.
+    (e_mu, e_kappa, i_mu, i_kappa, r0) = [df[col].to_numpy() for col in COLS]
+    pmf = generation_interval_pmf(e_mu, e_kappa, i_mu, i_kappa, length) # generation-interval pmf
+    incidence = renewal_incidence(r0, pmf, horizon) # daily incidence I(t)
+    # Checks the empirical growth rate against theta_solve (nan and False if not supercritical or unsolved).
+    lambdas, agrees = growth_rate_check(incidence, e_mu, e_kappa, i_mu, i_kappa, r0, window=argument.window)
+    empirical_lambdas = growth_rate(incidence, window=argument.window)
+    for index, lambda_, empirical_lambda, agree in zip(df.index, lambdas, empirical_lambdas, agrees):
+        print('parameter set', index, ': lambda =', lambda_, 'empirical lambda =', empirical_lambda, 'agree =', agree)
+    df = argument.df[COLS]
+    df['lambda'] = lambdas # exponential rate of infection from theta_solve
+    df['empirical_lambda'] = empirical_lambdas # exponential rate of infection from incidence
+    df['lambda_agrees'] = agrees
+    df_incidence = pd.DataFrame(incidence, columns=[i for i in range(horizon+1)], index=df.index)
+    df = pd.concat([df,df_incidence], axis=1)
+    df.to_csv(argument.ofn, index=False)
+# Reads the string from argument.ifn, a CSV DataFrame with columns COLS.
+def to_df(string):
+    ifh = StringIO(string)
+    df = pd.read_csv(ifh, sep=',', dtype={COLS[0]:float,COLS[1]:float,COLS[2]:float,COLS[3]:float,COLS[4]:float})
+    arr = df.to_numpy()
+    if (np.abs(arr) <= 0.0).any():
+        raise ValueError('The dataframe elements must be positive.')
+    return df
+# Checks arguments.
+def check(argument):
+    # argument.odir is the output directory.
+    odir = dirname(argument.ofn)
+    if not exists(odir):
+        mkdir(odir)
+    # argument.ifn contains a DataFrames with columns
+    #    'e->i_mean' : E gamma distribution mean
+    #    'e->i_dispersion' : E gamma distribution dispersion
+    #    'i->r_mean' : I gamma distribution mean
+    #    'i->r_dispersion' : I gamma distribution mean
+    #    's->e:i_R_0' : I mean basic reproduction number
+    if not isfile(argument.ifn):
+        raise ValueError(f'Input file "{argument.ifn}" does not exist.')
+    try:
+        with open(argument.ifn, 'r') as ifh:
+            string = ifh.read()
+    except:
+        raise ValueError(f'The read of the input file "{argument.ifn}" failed.')
+    try:
+        argument.df = to_df(string)
+    except:
+        raise ValueError(f'The input file "{argument.ifn}" contained bad values.')
+    if not isinstance(argument.horizon, int) or argument.horizon <= 0:
+        raise ValueError(f'argument.horizon "{argument.horizon}" must be a positive integer.')
+    if argument.length is not None and (not isinstance(argument.length, int) or argument.length <= 0):
+        raise ValueError(f'argument.length "{argument.length}" must be a positive integer.')
+    if not isinstance(argument.window, int) or not 0 < argument.window < argument.horizon:
+        raise ValueError(f'argument.window "{argument.window}" must be a positive integer less than argument.horizon.')
+
+def getArguments():
+    parser = argparse.ArgumentParser(description='Calculates the daily incidence from the renewal equation for SEIR model, where E and I are gamma-distributed.\n')
+    parser.add_argument("-o", "--ofn", dest="ofn", type=str, default='../../Output/Renewal/renewal.csv',
+                        help="OFN contains the output DataFrame with the daily incidence.", metavar="OFN")
+    parser.add_argument("-i", "--ifn", dest="ifn", type=str, required=True,
+                        help="IFN is a CSV with DataFrame whose columns define the parameters of the gamma distributions.", metavar="IFN")
+    parser.add_argument("-t", "--horizon", dest="horizon", type=int, required=True,
+                        help="HORIZON counts the days of incidence after the primary infection on day 0.", metavar="HORIZON")
+    parser.add_argument("-l", "--length", dest="length", type=int, default=None,
+                        help="LENGTH counts the days in the truncated generation-interval pmf (HORIZON).", metavar="LENGTH")
+    parser.add_argument("-w", "--window", dest="window", type=int, default=7,
+                        help="WINDOW counts the final days for the empirical growth rate (7).", metavar="WINDOW")
+    return parser
+
+if __name__ == "__main__":
+    main()
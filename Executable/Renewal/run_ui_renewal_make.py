@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+
+from os import system
+
+log = f'run_ui_renewal.log'
+
+# Explanations follow each option as a comment after '#', with (defaults) in parentheses.
+O = ' -o ../../Output/Renewal/renewal.csv' # -o output filename
+I = ' -i ../../Data/Renewal/renewal0.csv' # -i input filename
+T = ' -t 365' # the days of incidence after the primary infection
+L = ' -l 120' # the days in the truncated generation-interval pmf (HORIZON)
+W = ' -w 7' # the final days for the empirical growth rate (7)
+
+system( f'python run_ui_renewal.py {O} {I} {T} {L} {W} > {log}' )
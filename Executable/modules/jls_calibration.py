@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+"""
+Calibrates epidemic parameters from observed q, gamma, or the exponent lambda (vectorized inverse solvers).
+"""
+import sys
+sys.path.insert(0,"../modules")
+
+from math import isclose, log
+import numpy as np
+
+from jls_branching_process import Branching_Process_Factory
+from jls_epidemic_exponent import theta_solve, _laplace_exposed, _laplace_infectious
+
+#
+# Each solver accepts scalars or numpy arrays (broadcast against each other)
+#    and returns the solutions and feasible, where the solutions are nan wherever feasible is False.
+#
+# The forward equations for the offspring distribution Negative_Binomial( k, p ) with p = k/(r0+k) are
+#    q = (1+r0*(1-q)/k)**(-k) , so r0 = k*(q**(-1/k)-1)/(1-q) , and
+#    gamma = r0*q**(1+1/k) = k*q*(1-q**(1/k))/(1-q).
+# The Poisson (dispersion=None) equations are the limits k -> infinity:
+#    r0 = -log(q)/(1-q) and gamma = r0*q.
+#
+
+# Safeguarded Newton iteration for the increasing function f on the brackets (lo, hi) with f(lo) < 0 < f(hi).
+#    f_df(x) returns the values of f and its derivative at x. Bisection replaces Newton steps leaving the bracket
+#    or failing to halve the previous step. Returns the root and whether the iteration converged.
+#    x0 optionally starts the iteration inside the brackets (e.g., warm starts), instead of at their midpoints.
+def _newton_bisect(f_df, lo, hi, rtol=1.0e-12, max_iter=200, x0=None):
+    lo = np.array(lo, dtype=float)
+    hi = np.array(hi, dtype=float)
+    x = 0.5*(lo+hi) if x0 is None else np.where((lo < x0) & (x0 < hi), x0, 0.5*(lo+hi))
+    dx_old = hi-lo # the previous step
+    active = np.ones(x.shape, dtype=bool)
+    for _ in range(max_iter):
+        f, df = f_df(x)
+        lo = np.where(active & (f < 0.0), x, lo)
+        hi = np.where(active & (f > 0.0), x, hi)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            x_new = x-f/df
+        # A converged Newton step may round onto a bracket, so it is tested before any bisection replaces it.
+        done = (f == 0.0) | (np.isfinite(df) & (np.abs(x_new-x) <= rtol*np.abs(x))) | (hi-lo <= rtol*np.abs(x))
+        bad = ~np.isfinite(x_new) | (x_new <= lo) | (hi <= x_new) | (0.5*dx_old < np.abs(x_new-x))
+        x_new = np.where(bad & ~done, 0.5*(lo+hi), x_new)
+        dx_old = np.abs(x_new-x)
+        x = np.where(active, x_new, x)
+        active &= ~done
+        if not active.any():
+            break
+    return x, ~active
+# Returns r0 from the extinction probability q.
+#    r0 overflows for q close to 0 when the dispersion is small, and is then infeasible.
+def r0_from_q(q, dispersion=None):
+    q = np.asarray(q, dtype=float)
+    if dispersion is None:
+        q, = np.broadcast_arrays(q)
+    else:
+        q, k = np.broadcast_arrays(q, np.asarray(dispersion, dtype=float))
+    feasible = (0.0 < q) & (q < 1.0)
+    if dispersion is not None:
+        feasible &= 0.0 < k
+    qf = np.where(feasible, q, 0.5)
+    if dispersion is None:
+        r0 = -np.log(qf)/(1.0-qf)
+    else:
+        kf = np.where(feasible, k, 1.0)
+        with np.errstate(over='ignore'):
+            r0 = kf*np.expm1(-np.log(qf)/kf)/(1.0-qf)
+    feasible &= np.isfinite(r0)
+    return np.where(feasible, r0, np.nan), feasible
+# Returns the Negative_Binomial dispersion k from the extinction probability q and r0.
+#    Feasible if and only if r0 exceeds the Poisson r0 for q, i.e., r0*(1-q) > -log(q).
+def dispersion_from_q(q, r0):
+    q, r0 = np.broadcast_arrays(np.asarray(q, dtype=float), np.asarray(r0, dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ell = -np.log(q)
+        c = r0*(1.0-q)
+        feasible = (0.0 < q) & (q < 1.0) & (ell < c)
+    ell = np.where(feasible, ell, 1.0)
+    c = np.where(feasible, c, 2.0)
+    # Solves (exp(x*ell)-1)/x = c for x = 1/k, increasing from ell at x = 0.
+    def f_df(x):
+        with np.errstate(over='ignore', invalid='ignore'):
+            e = np.expm1(x*ell)
+            return e/x-c, (ell*(e+1.0)*x-e)/x**2
+    x, converged = _newton_bisect(f_df, np.zeros(q.shape), 2.0*c/ell**2)
+    feasible &= converged
+    return np.where(feasible, 1.0/x, np.nan), feasible
+# Returns gamma = pgf'(q) as a function of q, along with its derivative wrt q.
+def _gamma_from_q(q, dispersion=None):
+    if dispersion is None:
+        gamma = -q*np.log(q)/(1.0-q)
+        dgamma = (-np.log(q)-(1.0-q))/(1.0-q)**2
+    else:
+        u = q**(1.0/dispersion)
+        gamma = dispersion*q*(1.0-u)/(1.0-q)
+        dgamma = (dispersion*(1.0-u)-u*(1.0-q))/(1.0-q)**2
+    return gamma, dgamma
+# Returns the supercritical extinction probability q from the renewal probability 0 < gamma < 1.
+#    q0 optionally warm-starts the iteration.
+def _q_from_gamma(gamma, dispersion=None, q0=None):
+    def f_df(q):
+        g, dg = _gamma_from_q(q, dispersion)
+        return g-gamma, dg
+    return _newton_bisect(f_df, np.zeros(gamma.shape), np.ones(gamma.shape), x0=q0)
+# Returns r0 from the renewal probability gamma, which increases with q from 0 to 1 for fixed dispersion.
+#    Every gamma in (0, 1) also comes from the subcritical process with r0 = gamma (q = 1, gamma = pgf'(1) = r0).
+#    The supercritical root is returned by default; subcritical=True returns the subcritical root r0 = gamma.
+def r0_from_gamma(gamma, dispersion=None, subcritical=False):
+    gamma = np.asarray(gamma, dtype=float)
+    if dispersion is None:
+        gamma, = np.broadcast_arrays(gamma)
+        k = None
+    else:
+        gamma, k = np.broadcast_arrays(gamma, np.asarray(dispersion, dtype=float))
+    feasible = (0.0 < gamma) & (gamma < 1.0)
+    if k is not None:
+        feasible &= 0.0 < k
+        k = np.where(feasible, k, 1.0)
+    if subcritical:
+        return np.where(feasible, gamma, np.nan), feasible
+    q, converged = _q_from_gamma(np.where(feasible, gamma, 0.5), k)
+    feasible &= converged
+    r0, finite = r0_from_q(q, k)
+    feasible &= finite
+    return np.where(feasible, r0, np.nan), feasible
+# Returns (r0, dispersion) jointly from the extinction probability q and the renewal probability gamma.
+#    Feasible if and only if 0 < gamma*(1-q)/q < -log(q), the upper bound being the Poisson limit.
+def r0_dispersion_from_q_gamma(q, gamma):
+    q, gamma = np.broadcast_arrays(np.asarray(q, dtype=float), np.asarray(gamma, dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ell = -np.log(q)
+        c = gamma*(1.0-q)/q
+        feasible = (0.0 < q) & (q < 1.0) & (0.0 < gamma) & (c < ell)
+    ell = np.where(feasible, ell, 2.0)
+    c = np.where(feasible, c, 1.0)
+    # Solves c-(1-exp(-x*ell))/x = 0 for x = 1/k, increasing from c-ell at x = 0.
+    def f_df(x):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            e = -np.expm1(-x*ell)
+            return c-e/x, (e-ell*(1.0-e)*x)/x**2
+    x, converged = _newton_bisect(f_df, np.zeros(q.shape), 1.0/c)
+    feasible &= converged
+    k = np.where(feasible, 1.0/x, np.nan)
+    r0, finite = r0_from_q(np.where(feasible, q, 0.5), np.where(feasible, k, 1.0))
+    feasible &= finite
+    k = np.where(feasible, k, np.nan)
+    return np.where(feasible, r0, np.nan), k, feasible
+# Returns the exponential rate of infection (lambda) from the doubling time.
+def lambda_from_doubling_time(doubling_time):
+    doubling_time = np.asarray(doubling_time, dtype=float)
+    with np.errstate(divide='ignore'):
+        return np.where(0.0 < doubling_time, log(2.0)/doubling_time, np.nan)
+# Returns the Laplace transform of the uniform distribution on the infectious period as a function of
+#    x = theta*mu/kappa, along with its derivative wrt x. Cf. _laplace_infectious in jls_epidemic_exponent.
+#    The exponential infectious period kappa == 1 uses the limit log(1+x)/x.
+def _laplace_infectious_x(x, kappa):
+    a = kappa-1.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        laplace = np.where(a == 0.0, np.log1p(x)/x, -np.expm1(-a*np.log1p(x))/(a*x))
+    dlaplace = (1.0+x)**(-a-1.0)/x-laplace/x
+    return laplace, dlaplace
+# Returns the derivative wrt kappa of _laplace_infectious_x at fixed x.
+def _laplace_infectious_dkappa(x, kappa, laplace):
+    a = kappa-1.0
+    log1p = np.log1p(x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(a == 0.0, -0.5*log1p**2/x, ((1.0+x)**(-a)*log1p-x*laplace)/(a*x))
+# Returns r0 from the exponential rate of infection (lambda), in closed form.
+def r0_from_lambda(theta, e_mu, e_kappa, i_mu, i_kappa):
+    theta, e_mu, e_kappa, i_mu, i_kappa = np.broadcast_arrays(
+        *[np.asarray(v, dtype=float) for v in (theta, e_mu, e_kappa, i_mu, i_kappa)])
+    feasible = (0.0 < theta) & (0.0 < e_mu) & (0.0 < e_kappa) & (0.0 < i_mu) & (0.0 < i_kappa)
+    theta = np.where(feasible, theta, 1.0)
+    i_kappa = np.where(feasible, i_kappa, 2.0)
+    laplace_i, _ = _laplace_infectious_x(theta*i_mu/i_kappa, i_kappa)
+    r0 = 1.0/(_laplace_exposed(theta, e_mu, e_kappa)*laplace_i)
+    return np.where(feasible, r0, np.nan), feasible
+# Returns the infectious mean i_mu from the exponential rate of infection (lambda), given the other parameters.
+#    Feasible if and only if r0*laplace_exposed(theta) > 1, because the infectious Laplace transform decreases from 1 to 0.
+def i_mu_from_lambda(theta, e_mu, e_kappa, i_kappa, r0):
+    theta, e_mu, e_kappa, i_kappa, r0 = np.broadcast_arrays(
+        *[np.asarray(v, dtype=float) for v in (theta, e_mu, e_kappa, i_kappa, r0)])
+    feasible = (0.0 < theta) & (0.0 < e_mu) & (0.0 < e_kappa) & (0.0 < i_kappa) & (0.0 < r0)
+    with np.errstate(invalid='ignore'):
+        target = 1.0/(r0*_laplace_exposed(theta, e_mu, e_kappa)) # target for the infectious Laplace transform
+    feasible &= target < 1.0
+    target = np.where(feasible, target, 0.5)
+    i_kappa = np.where(feasible, i_kappa, 2.0)
+    # Solves target-laplace_infectious(x) = 0 in y = log(x), increasing in y.
+    def f_df(y):
+        x = np.exp(y)
+        laplace, dlaplace = _laplace_infectious_x(x, i_kappa)
+        return target-laplace, -dlaplace*x
+    # Expands the brackets in y until they contain the root.
+    lo = np.full(target.shape, -1.0)
+    hi = np.full(target.shape, 1.0)
+    for _ in range(64):
+        f_lo, _ = f_df(lo)
+        f_hi, _ = f_df(hi)
+        if (f_lo < 0.0).all() and (0.0 < f_hi).all():
+            break
+        lo = np.where(f_lo < 0.0, lo, 2.0*lo)
+        hi = np.where(0.0 < f_hi, hi, 2.0*hi)
+    y, converged = _newton_bisect(f_df, lo, hi)
+    feasible &= converged
+    i_mu = np.exp(y)*i_kappa/np.where(feasible, theta, 1.0)
+    return np.where(feasible, i_mu, np.nan), feasible
+# Returns (r0, dispersion = i_kappa) jointly from the exponential rate of infection (lambda)
+#    and either the extinction probability q or the renewal probability gamma (supercritical root),
+#    given e_mu, e_kappa, and i_mu. The dispersion of the offspring distribution is the infectious shape i_kappa.
+#    A doubling time converts to lambda with lambda_from_doubling_time.
+#    With k = i_kappa, log(r0) from lambda increases with k and log(r0) from q or gamma decreases with k,
+#    so their difference has at most one root, found in log(k) on [log_k_min, log_k_max].
+def r0_dispersion_from_lambda(theta, e_mu, e_kappa, i_mu, q=None, gamma=None, log_k_min=-15.0, log_k_max=15.0):
+    assert (q is None) != (gamma is None)
+    target = np.asarray(q if gamma is None else gamma, dtype=float)
+    theta, e_mu, e_kappa, i_mu, target = np.broadcast_arrays(
+        *[np.asarray(v, dtype=float) for v in (theta, e_mu, e_kappa, i_mu, target)])
+    feasible = (0.0 < theta) & (0.0 < e_mu) & (0.0 < e_kappa) & (0.0 < i_mu) & (0.0 < target) & (target < 1.0)
+    theta, e_mu, e_kappa, i_mu = [np.where(feasible, v, 1.0) for v in (theta, e_mu, e_kappa, i_mu)]
+    target = np.where(feasible, target, 0.5)
+    with np.errstate(divide='ignore'):
+        log_laplace_e = np.log(_laplace_exposed(theta, e_mu, e_kappa))
+    ell = -np.log(target)
+    # Returns log(r0) from lambda and its derivative wrt k.
+    def log_r0_lambda(k):
+        x = theta*i_mu/k
+        laplace, dlaplace = _laplace_infectious_x(x, k)
+        dkappa = _laplace_infectious_dkappa(x, k, laplace)
+        return -log_laplace_e-np.log(laplace), -(dkappa-dlaplace*x/k)/laplace
+    # Returns log(r0) from q and its derivative wrt k.
+    def log_r0_q(k):
+        e = -np.expm1(-ell/k)
+        return np.log(k)+ell/k+np.log(e)-np.log1p(-target), 1.0/k-ell/(k**2*e)
+    # Returns log(r0) from gamma and its derivative wrt k, through q(k) solving gamma(q, k) = gamma.
+    #    Each solve for q(k) is warm-started from the previous one, and its failures make the row infeasible.
+    q_prev = np.full(target.shape, 0.5)
+    q_converged = np.ones(target.shape, dtype=bool)
+    def log_r0_gamma(k):
+        q_k, converged = _q_from_gamma(target, k, q_prev)
+        q_prev[...] = q_k
+        q_converged[...] &= converged
+        log_q = np.log(q_k)
+        u = np.exp(log_q/k)
+        _, dgamma_dq = _gamma_from_q(q_k, k)
+        dgamma_dk = q_k/(1.0-q_k)*((1.0-u)+u*log_q/k)
+        dq_dk = -dgamma_dk/dgamma_dq
+        return np.log(target)-(1.0+1.0/k)*log_q, -(1.0+1.0/k)*dq_dk/q_k+log_q/k**2
+    log_r0_target = log_r0_q if gamma is None else log_r0_gamma
+    # Solves log_r0_lambda(k)-log_r0_target(k) = 0 in y = log(k), increasing in y.
+    def f_df(y):
+        k = np.exp(y)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            g_lambda, dg_lambda = log_r0_lambda(k)
+            g_target, dg_target = log_r0_target(k)
+        return np.where(active, g_lambda-g_target, y), np.where(active, k*(dg_lambda-dg_target), 1.0)
+    active = feasible.copy()
+    lo = np.full(target.shape, log_k_min)
+    hi = np.full(target.shape, log_k_max)
+    feasible &= (f_df(lo)[0] < 0.0) & (0.0 < f_df(hi)[0])
+    active = feasible.copy()
+    y, converged = _newton_bisect(f_df, np.where(feasible, lo, -1.0), np.where(feasible, hi, 1.0))
+    feasible &= converged
+    k = np.exp(y)
+    log_r0, _ = log_r0_target(np.where(feasible, k, 1.0))
+    feasible &= q_converged # only the gamma path updates q_converged
+    return np.where(feasible, np.exp(log_r0), np.nan), np.where(feasible, k, np.nan), feasible
+
+def test_calibration():
+    # Tests r0_from_q and r0_from_gamma against Branching_Process_Factory.
+    for (r0, dispersion) in [(2.0, None), (3.0, None), (2.0, 1.0), (1.5, 1.0), (3.0, 0.5), (2.5, 0.2)]:
+        bp = Branching_Process_Factory(r0=r0, dispersion=dispersion)
+        (q, gamma) = (bp.q(), bp.gamma())
+        r0_q, feasible = r0_from_q(q, dispersion)
+        assert feasible and isclose(r0_q, r0, rel_tol=1.0e-06)
+        r0_gamma, feasible = r0_from_gamma(gamma, dispersion)
+        assert feasible and isclose(r0_gamma, r0, rel_tol=1.0e-06)
+        if dispersion is not None:
+            k, feasible = dispersion_from_q(q, r0)
+            assert feasible and isclose(k, dispersion, rel_tol=1.0e-06)
+            r0_qg, k, feasible = r0_dispersion_from_q_gamma(q, gamma)
+            assert feasible and isclose(r0_qg, r0, rel_tol=1.0e-06) and isclose(k, dispersion, rel_tol=1.0e-06)
+    # Tests the vectorized round trips over a grid of (r0, k).
+    r0s, ks = np.meshgrid(np.linspace(1.1, 8.0, 25), np.geomspace(0.05, 50.0, 25))
+    p = ks/(r0s+ks)
+    q = np.full(r0s.shape, 0.0)
+    for _ in range(20000): # fixed-point iteration from 0 converges to the extinction probability
+        q = (p/(1.0-(1.0-p)*q))**ks
+    gamma, _ = _gamma_from_q(q, ks)
+    r0_q, feasible = r0_from_q(q, ks)
+    assert feasible.all() and np.allclose(r0_q, r0s, rtol=1.0e-06)
+    r0_gamma, feasible = r0_from_gamma(gamma, ks)
+    assert feasible.all() and np.allclose(r0_gamma, r0s, rtol=1.0e-06)
+    k, feasible = dispersion_from_q(q, r0s)
+    assert feasible.all() and np.allclose(k, ks, rtol=1.0e-06)
+    r0_qg, k, feasible = r0_dispersion_from_q_gamma(q, gamma)
+    assert feasible.all() and np.allclose(r0_qg, r0s, rtol=1.0e-06) and np.allclose(k, ks, rtol=1.0e-06)
+    r0_gamma, feasible = r0_from_gamma(gamma, ks, subcritical=True)
+    assert feasible.all() and np.allclose(r0_gamma, gamma)
+    bp = Branching_Process_Factory(r0=0.6, dispersion=0.5) # subcritical
+    assert isclose(r0_from_gamma(bp.probability_generating_function(1.0, n=1), 0.5, subcritical=True)[0], 0.6)
+    # Tests the reporting of infeasible targets.
+    f_df = lambda x: (np.expm1(x)-1.0, np.exp(x))
+    _, converged = _newton_bisect(f_df, 0.0, 50.0, max_iter=3) # too few iterations
+    assert not converged
+    x, converged = _newton_bisect(f_df, 0.0, 50.0)
+    assert converged and isclose(x, log(2.0))
+    gamma, _ = _gamma_from_q(0.58, 0.3) # the converged Newton step rounds onto hi
+    f_df = lambda q: (_gamma_from_q(q, 0.3)[0]-gamma, _gamma_from_q(q, 0.3)[1])
+    q, converged = _newton_bisect(f_df, 0.0, 1.0, max_iter=10)
+    assert converged and isclose(q, 0.58, rel_tol=1.0e-12)
+    k, feasible = dispersion_from_q(0.5, 1000.0) # far from the root of the Newton iteration
+    bp = Branching_Process_Factory(r0=1000.0, dispersion=float(k))
+    assert feasible and isclose(bp.q(), 0.5, rel_tol=1.0e-06)
+    _, feasible = r0_from_q([0.0, 0.5, 1.0, 1.5])
+    assert feasible.tolist() == [False, True, False, False]
+    with np.errstate(over='raise'): # r0 overflows for small dispersion
+        r0_q, feasible = r0_from_q([0.1, 0.5, 0.5], [1.0e-03, 1.0e-03, 1.0])
+        assert feasible.tolist() == [False, True, True] and np.isnan(r0_q[0]) and isclose(r0_q[2], 2.0)
+        r0_gamma, feasible = r0_from_gamma(1.0e-09, 1.0e-03)
+        assert not feasible and np.isnan(r0_gamma)
+    bp = Branching_Process_Factory(r0=2.0) # Poisson
+    k, feasible = dispersion_from_q([bp.q(), 0.5], [2.0, 2.0]) # r0 too small for any Negative_Binomial
+    assert feasible.tolist() == [False, True] and np.isnan(k[0]) and isclose(k[1], 1.0, rel_tol=1.0e-06)
+    _, _, feasible = r0_dispersion_from_q_gamma([0.5, 0.5], [0.25, log(2.0)]) # Poisson limit
+    assert feasible.tolist() == [True, False]
+    # Tests the inverses of theta_solve.
+    (e_mu, e_kappa, i_mu, i_kappa, r0) = (3.5, 4, 5.5, 0.3, 2)
+    theta = theta_solve(e_mu, e_kappa, i_mu, i_kappa, r0)[0]
+    assert isclose(_laplace_infectious_x(theta*i_mu/i_kappa, i_kappa)[0],
+                   _laplace_infectious(theta, i_mu, i_kappa), rel_tol=1.0e-09)
+    r0_theta, feasible = r0_from_lambda(theta, e_mu, e_kappa, i_mu, i_kappa)
+    assert feasible and isclose(r0_theta, r0, rel_tol=1.0e-06)
+    i_mu_theta, feasible = i_mu_from_lambda(lambda_from_doubling_time(log(2.0)/theta), e_mu, e_kappa, i_kappa, r0)
+    assert feasible and isclose(i_mu_theta, i_mu, rel_tol=1.0e-06)
+    i_mus = np.array([0.5, 2.0, 5.5, 20.0])
+    i_kappas = np.array([0.3, 2.0, 4.0, 0.8])
+    thetas = np.array([theta_solve(e_mu, e_kappa, m, k, r0)[0] for m,k in zip(i_mus, i_kappas)])
+    i_mu_theta, feasible = i_mu_from_lambda(thetas, e_mu, e_kappa, i_kappas, r0)
+    assert feasible.all() and np.allclose(i_mu_theta, i_mus, rtol=1.0e-06)
+    # Tests the exponential infectious period i_kappa == 1 against its neighbours.
+    laplace, dlaplace = _laplace_infectious_x(np.array([0.1, 2.0, 50.0]), 1.0)
+    for kappa in (1.0-1.0e-07, 1.0+1.0e-07):
+        assert np.allclose(_laplace_infectious_x(np.array([0.1, 2.0, 50.0]), kappa), (laplace, dlaplace), rtol=1.0e-06)
+    assert np.allclose(dlaplace, 1.0/(np.array([0.1, 2.0, 50.0])*np.array([1.1, 3.0, 51.0]))-laplace/np.array([0.1, 2.0, 50.0]))
+    r0_theta, feasible = r0_from_lambda(theta, e_mu, e_kappa, i_mu, 1.0)
+    r0_near, _ = r0_from_lambda(theta, e_mu, e_kappa, i_mu, 1.0+1.0e-07)
+    assert feasible and isclose(r0_theta, r0_near, rel_tol=1.0e-06)
+    i_mu_theta, feasible = i_mu_from_lambda(theta, e_mu, e_kappa, 1.0, r0_theta)
+    assert feasible and isclose(i_mu_theta, i_mu, rel_tol=1.0e-06)
+    _, feasible = i_mu_from_lambda(1.0, e_mu, e_kappa, i_kappa, r0) # too fast for the latent period
+    assert not feasible
+    # Tests the joint inverse of theta_solve and Branching_Process_Factory with dispersion = i_kappa.
+    assert np.allclose(_laplace_infectious_dkappa(np.array([0.1, 2.0]), np.array([0.3, 1.0]), 
+                                                  _laplace_infectious_x(np.array([0.1, 2.0]), np.array([0.3, 1.0]))[0]),
+                       [(_laplace_infectious_x(0.1, 0.3+1.0e-06)[0]-_laplace_infectious_x(0.1, 0.3-1.0e-06)[0])/2.0e-06,
+                        (_laplace_infectious_x(2.0, 1.0+1.0e-06)[0]-_laplace_infectious_x(2.0, 1.0-1.0e-06)[0])/2.0e-06],
+                       rtol=1.0e-06)
+    rows = [(3.5, 4.0, 5.5, 0.3, 2.0), (3.5, 4.0, 5.5, 0.7, 3.0), (2.0, 1.5, 8.0, 4.0, 1.5), (5.0, 0.8, 3.0, 20.0, 2.5)]
+    thetas, qs, gammas = [], [], []
+    for (e_mu, e_kappa, i_mu, i_kappa, r0) in rows:
+        thetas.append(theta_solve(e_mu, e_kappa, i_mu, i_kappa, r0)[0])
+        bp = Branching_Process_Factory(r0=r0, dispersion=i_kappa)
+        qs.append(bp.q())
+        gammas.append(bp.gamma())
+    (e_mus, e_kappas, i_mus, i_kappas, r0s) = [np.array(col) for col in zip(*rows)]
+    doubling_times = log(2.0)/np.array(thetas)
+    for (q, gamma) in [(qs, None), (None, gammas)]:
+        r0_joint, k, feasible = r0_dispersion_from_lambda(lambda_from_doubling_time(doubling_times),
+                                                          e_mus, e_kappas, i_mus, q=q, gamma=gamma)
+        assert feasible.all() and np.allclose(r0_joint, r0s, rtol=1.0e-05) and np.allclose(k, i_kappas, rtol=1.0e-04)
+    # The Poisson limit bounds q from below: for q close to 0, no dispersion reproduces lambda.
+    r0_joint, k, feasible = r0_dispersion_from_lambda(thetas[0], 3.5, 4.0, 5.5, q=[qs[0], 1.0e-06, 1.5])
+    assert feasible.tolist() == [True, False, False] and np.isnan(k[1:]).all()
+
+def main():
+    test_calibration()
+
+if __name__ == "__main__":
+    main()